@@ -37,8 +37,15 @@ import tunempc.closed_loop_tools as clt
 import numpy as np
 import casadi as ca
 import casadi.tools as ct
+import os
+import matplotlib
+if os.environ.get('BENCH'):
+    matplotlib.use('Agg') # headless backend for benchmark runs
 import matplotlib.pyplot as plt
 
+# just-in-time compilation of CasADi functions
+jit_opts = {'jit': True, 'compiler': 'shell', 'jit_options': {'flags': ['-O3','-march=native','-ffast-math']}}
+
 def problem_data():
 
     """ Problem data, numeric constants,...
@@ -84,6 +91,15 @@ def intermediate_vars(x, u, data):
     data['F4'] = (data['Q100']-data['F1']*data['Cp']*(data['T2']-data['T1']))/data['lam']
     data['F2'] = data['F1'] - data['F4'] 
 
+    # shared intermediate flows, evaluated once per call site
+    data['aux'] = ca.Function(
+        'aux',
+        [x,u],
+        [data['F2'], data['F4'], data['F5'], data['F100']],
+        ['x','u'],
+        ['F2','F4','F5','F100']
+        )
+
     return data
 
 def dynamics(x, u, data):
@@ -91,14 +107,18 @@ def dynamics(x, u, data):
     """ System dynamics function (discrete time)
     """
 
+    # intermediate variables
+    F2, F4, F5, _ = data['aux'](x,u)
+
     # state derivative expression
     xdot = ca.vertcat(
-        (data['F1']*data['X1'] - data['F2']*x['X2'])/data['M'],
-        (data['F4'] - data['F5'])/data['C']
+        (data['F1']*data['X1'] - F2*x['X2'])/data['M'],
+        (F4 - F5)/data['C']
         )
 
-    # create ode for integrator
-    ode = {'x':x, 'p':u,'ode': xdot}
+    # create ode for integrator (expanded to SX for common subexpression collapse)
+    f = ca.Function('f',[x,u],[xdot]).expand('f',jit_opts)
+    ode = {'x':x, 'p':u,'ode': f(x,u)}
 
     return ca.integrator('F','collocation',ode,{'tf':1})
 
@@ -117,10 +137,13 @@ def objective(x, u, data):
     """ Economic objective function
     """
     
+    # intermediate variables
+    F2, _, _, F100 = data['aux'](x,u)
+
     # cost definition
-    obj = 10.09*(data['F2']+data['F3']) + 600.0*data['F100'] + 0.6*u['F200']
+    obj = 10.09*(F2+data['F3']) + 600.0*F100 + 0.6*u['F200']
 
-    return ca.Function('economic_cost',[x,u],[obj])
+    return ca.Function('economic_cost',[x,u],[obj]).expand('economic_cost',jit_opts)
 
 def constraints(x, u, data):
     
@@ -135,7 +158,7 @@ def constraints(x, u, data):
         400.0 - u['F200'],
     )
 
-    return ca.Function('h', [x,u], [constr])
+    return ca.Function('h', [x,u], [constr]).expand('h', jit_opts)
 
 
 # set-up system
@@ -175,13 +198,17 @@ ctrls['tracking'] = tuner.create_mpc('tracking',N = N, tuning = tuningTn)
 ctrls['tuned'] = tuner.create_mpc('tuned',N = N)
 
 alpha = [0.1, 0.5, 1.0]
-log = clt.check_equivalence(ctrls, objective(x,u,data), sys['h'], wsol['x',0], ca.vertcat(0.0, 10.0), alpha)
+log = clt.check_equivalence(ctrls, objective(x,u,data), sys['h'], wsol['x',0], ca.vertcat(0.0, 10.0), alpha, processes = len(alpha))
+
+# feedback controls (alpha x controller x control)
+names = list(ctrls.keys())
+U_log = np.array([[np.array(log[j]['u'][name][0]).ravel() for name in names] for j in range(len(alpha))])
 
 # plot feedback controls to check equivalence
-for name in list(ctrls.keys()):
-    for i in range(nu):
-        plt.figure(i)
-        plt.plot(alpha, [log[j]['u'][name][0][i] for j in range(len(alpha))])
-        plt.legend(list(ctrls.keys()))
+for i in range(nu):
+    plt.figure(i)
+    for n_idx, name in enumerate(names):
+        plt.plot(alpha, U_log[:,n_idx,i])
+    plt.legend(names)
 
 plt.show()
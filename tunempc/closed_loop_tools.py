@@ -24,11 +24,14 @@
 """
 
 import matplotlib.pyplot as plt
+import multiprocessing
 from tunempc.logger import Logger
 
-def check_equivalence(controllers, cost, h, x0, dx, alpha):
+def check_equivalence(controllers, cost, h, x0, dx, alpha, processes = 1):
 
     """ Check local equivalence of different controllers.
+    For processes > 1, the alpha values are distributed over a pool of
+    forked worker processes, each operating on its own copy of the controllers.
     """
 
     Logger.logger.info(60*'=')
@@ -36,33 +39,64 @@ def check_equivalence(controllers, cost, h, x0, dx, alpha):
     Logger.logger.info(60*'=')
     Logger.logger.info('')
 
-    log = []
+    # determine initial conditions
+    x_init = [x0 + alph*dx for alph in alpha]
 
     # compute feedback law in direction dx for different alpha values
-    for alph in alpha:
+    if processes > 1:
+        with multiprocessing.get_context('fork').Pool(
+            processes,
+            initializer = init_feedback_worker,
+            initargs = (controllers, cost, h)) as pool:
+            log = pool.map(feedback_worker, zip(alpha, x_init))
+    else:
+        log = [compute_feedback(controllers, cost, h, alph, x) for alph, x in zip(alpha, x_init)]
 
-        # determine initial condition
-        print('alpha: {}'.format(alph))
-        x_init = x0 + alph*dx
+    return log
 
-        log.append(initialize_log(controllers, x_init))
+def compute_feedback(controllers, cost, h, alph, x_init):
 
-        for name in list(controllers.keys()):
+    """ Compute and log feedback law of different controllers for given initial condition.
+    """
 
-            # compute feedback law and store results
-            print('Compute MPC feedback for controller {}'.format(name))
-            u0 = controllers[name].step(x_init)
-            wsol = controllers[name].w_sol
-            log[-1]['u'][name] = wsol['u',:]
-            log[-1]['x'][name] = wsol['x',:]
-            log[-1]['l'][name] = [cost(wsol['x',k],wsol['u',k]).full()[0][0] for k in range(len(wsol['u',:]))]
-            log[-1]['h'][name] = [h(wsol['x',k],wsol['u',k]).full()[0][0] for k in range(len(wsol['u',:]))]
+    print('alpha: {}'.format(alph))
+    log = initialize_log(controllers, x_init)
 
-            # reset controller
-            controllers[name].reset()
+    for name in list(controllers.keys()):
+
+        # compute feedback law and store results
+        print('Compute MPC feedback for controller {}'.format(name))
+        u0 = controllers[name].step(x_init)
+        wsol = controllers[name].w_sol
+        log['u'][name] = wsol['u',:]
+        log['x'][name] = wsol['x',:]
+        log['l'][name] = [cost(wsol['x',k],wsol['u',k]).full()[0][0] for k in range(len(wsol['u',:]))]
+        log['h'][name] = [h(wsol['x',k],wsol['u',k]).full()[0][0] for k in range(len(wsol['u',:]))]
+
+        # reset controller
+        controllers[name].reset()
 
     return log
 
+# controllers and functions of forked feedback workers
+worker_data = {}
+
+def init_feedback_worker(controllers, cost, h):
+
+    """ Store (inherited) controllers and functions in feedback worker process.
+    """
+
+    worker_data['args'] = (controllers, cost, h)
+
+    return None
+
+def feedback_worker(args):
+
+    """ Compute feedback law of all controllers in worker process.
+    """
+
+    return compute_feedback(*worker_data['args'], *args)
+
 def closed_loop_sim(controllers, cost, h, F, x0, N):
 
     """ Perform closed-loop simulations for different controllers starting from x0
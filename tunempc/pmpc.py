@@ -132,6 +132,7 @@ class Pmpc(object):
         opts = {
             'hessian_approximation': 'exact',
             'ipopt_presolve': False,
+            'ipopt_options': {},
             'max_iter': 2000,
             'p_operator': None,
             'slack_flag': 'none'
@@ -329,11 +330,12 @@ class Pmpc(object):
 
         # create IPOPT-solver instance if needed
         if self.__options['ipopt_presolve']:
-            opts = {'ipopt':{'linear_solver':'ma57','print_level':0},'expand':False}
+            opts = {'ipopt':{'linear_solver':'ma57','print_level':0,'warm_start_init_point':'yes'},'expand':False}
             if Logger.logger.getEffectiveLevel() > 10:
                 opts['ipopt']['print_level'] = 0
                 opts['print_time'] = 0
                 opts['ipopt']['sb'] = 'yes'
+            opts['ipopt'].update(self.__options['ipopt_options']) # user-defined IPOPT options
             self.__solver = ca.nlpsol('solver', 'ipopt', prob, opts)
 
         # create hessian approximation function
@@ -374,11 +376,12 @@ class Pmpc(object):
             p0['tuning','H'] = self.__Href[self.__index]
             p0['tuning','q'] = self.__qref[self.__index]
 
-        # pre-solve NLP with IPOPT for globalization
+        # pre-solve NLP with IPOPT for globalization (warm-started with shifted primal-dual guess)
         if self.__options['ipopt_presolve']:
 
             ipopt_sol = self.__solver(
                 x0  = self.__w0,
+                lam_g0 = self.__lam_g0,
                 lbg = self.__lbg,
                 ubg = self.__ubg,
                 p   = p0